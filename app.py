@@ -1,5 +1,7 @@
+import hashlib
 import os
-from flask import Flask, render_template, request, redirect, url_for
+import threading
+from flask import Flask, render_template, request, redirect, url_for, jsonify, make_response
 from core.engine import BookStore
 
 app = Flask(__name__)
@@ -12,14 +14,47 @@ base_dir = os.path.dirname(os.path.abspath(__file__))
 data_path = os.path.join(base_dir, 'data')
 print(f"DEBUG: Looking for data in -> {data_path}")
 
-# 3. Initialize the Engine
-store = BookStore(data_dir=data_path)
+# 3. Initialize the Engine (lazy: JSON reads + FP-tree build happen on
+#    first use, not at import, so the server binds immediately)
+#
+# The store is a per-process singleton: re-imports (e.g. the Werkzeug
+# reloader importing app twice) reuse the same instance instead of
+# paying load_data() again. For multi-worker serving, run
+#     gunicorn --preload -w <N> app:app
+# so the store is built once in the master and fork()'d — copy-on-write
+# keeps the catalog shared across workers until a purchase mutates it.
+_store_cache = {}
+
+def get_store(data_dir):
+    if data_dir not in _store_cache:
+        _store_cache[data_dir] = BookStore(data_dir=data_dir, lazy=True)
+    return _store_cache[data_dir]
+
+store = get_store(data_path)
+
+# Catalog page size for /user/<id>; later pages load client-side from
+# the catalog.json endpoint instead of inflating the initial HTML
+CATALOG_PAGE_SIZE = 80
+
+
+def _profile_etag(user):
+    # The tag must move whenever anything on the page can: the catalog
+    # (books_version), the user's own history (user.version), and the
+    # recommendations — which also change when co-subscribers buy, so
+    # fold in the engine's freshness token for this user.
+    key = f"{store.books_version}:{user.user_id}:{user.version}:{store._ver_for(user.user_id)}"
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+# Warm the store in the background so the first visitor usually finds
+# everything already loaded instead of paying the cold-start cost.
+threading.Thread(target=store.ensure_loaded, daemon=True).start()
 
 
 # --- ROUTES ---
 #Route to ADD A NEW USER
 @app.route('/add_user', methods=['POST'])
 def add_user():
+    store.ensure_loaded()
     username = request.form.get('username')
     if username:
         new_id = store.register_user(username)
@@ -28,6 +63,7 @@ def add_user():
 # Route to ADD A NEW BOOK
 @app.route('/add_book', methods=['POST'])
 def add_book():
+    store.ensure_loaded()
     title = request.form.get('title')
     author = request.form.get('author')
     genre = request.form.get('genre')
@@ -45,9 +81,9 @@ def index():
     """
     Home Page: Shows the 'Select Persona' screen.
     """
-    # We convert values() to a list so the HTML can loop through it
-    users_list = list(store.users.values())
-    return render_template('index.html', users=users_list)
+    store.ensure_loaded()
+    # Incrementally maintained list — no per-request materialization
+    return render_template('index.html', users=store.users_list)
 
 
 @app.route('/user/<int:user_id>')
@@ -56,10 +92,16 @@ def user_profile(user_id):
     Profile Page: The Main Dashboard.
     Running the Recommendation Engine ON LOAD (Amazon Style).
     """
+    store.ensure_loaded()
     user = store.users.get(user_id)
     if not user:
         return "User not found", 404
 
+    # Unchanged page? Let the browser reuse its copy (304, no rendering)
+    etag = _profile_etag(user)
+    if request.if_none_match.contains(etag):
+        return '', 304
+
     # 1. Get My History (Book Objects)
     my_books = []
     for book_id in user.purchased_books:
@@ -71,16 +113,42 @@ def user_profile(user_id):
     recommendations = store.recommend_books(user_id)
 
     # 3. Prepare the Catalog (Exclude books I already bought)
-    catalog = []
-    for book in store.books.values():
-        if book.book_id not in user.purchased_books:
-            catalog.append(book)
-
-    return render_template('user_profile.html', 
-                           user=user, 
-                           my_books=my_books, 
+    #    Cached per user; only the first page is rendered server-side,
+    #    the rest is fetched from /user/<id>/catalog.json as needed.
+    page = request.args.get('page', 0, type=int)
+    size = request.args.get('size', CATALOG_PAGE_SIZE, type=int)
+    catalog = store.get_catalog(user_id)
+
+    resp = make_response(render_template('user_profile.html',
+                           user=user,
+                           my_books=my_books,
                            recommendations=recommendations, # Passing the AI results
-                           catalog=catalog)
+                           catalog=catalog[page * size:(page + 1) * size],
+                           catalog_total=len(catalog),
+                           catalog_page=page,
+                           catalog_size=size))
+    resp.set_etag(etag)
+    return resp
+
+
+@app.route('/user/<int:user_id>/catalog.json')
+def user_catalog(user_id):
+    """
+    Paged catalog data for client-side loading (ids + display fields only).
+    """
+    store.ensure_loaded()
+    user = store.users.get(user_id)
+    if not user:
+        return jsonify(error="User not found"), 404
+
+    page = request.args.get('page', 0, type=int)
+    size = request.args.get('size', CATALOG_PAGE_SIZE, type=int)
+    catalog = store.get_catalog(user_id)
+    books = catalog[page * size:(page + 1) * size]
+    return jsonify(total=len(catalog), page=page,
+                   books=[{"book_id": b.book_id, "title": b.title,
+                           "author": b.author, "genre": b.genre}
+                          for b in books])
 
 
 @app.route('/buy/<int:user_id>/<int:book_id>')
@@ -88,6 +156,7 @@ def buy_book(user_id, book_id):
     """
     Action Route: Processes a buy and redirects immediately.
     """
+    store.ensure_loaded()
     store.purchase_book(user_id, book_id)
     
     # Redirect back to the profile so the page refreshes 
@@ -99,4 +168,8 @@ def buy_book(user_id, book_id):
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # threaded=True lets concurrent visitors be served in parallel; the
+    # debug reloader only runs when explicitly requested via FLASK_DEBUG.
+    # For real traffic prefer:  gunicorn --preload -w $(nproc) app:app
+    debug = os.environ.get("FLASK_DEBUG") == "1"
+    app.run(host="0.0.0.0", port=5000, threaded=True, debug=debug)
\ No newline at end of file
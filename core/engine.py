@@ -1,40 +1,149 @@
+import heapq
 import json
 import os
-from collections import defaultdict
+import queue
+import threading
+from collections import Counter, defaultdict
+from itertools import combinations
 from core.models import Book, User
+from core.minhash import MinHashIndex
 
-# --- DATA STRUCTURE: FP-NODE ---
-class FPNode:
-    def __init__(self, item, count, parent):
-        self.item = item
-        self.count = count
-        self.parent = parent
-        self.children = {}
-        self.link = None
+# Optional fast path: one bincount reduction over contiguous index
+# arrays replaces thousands of Python-level dict/set operations when
+# numpy is installed.
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-    def increment(self, count):
-        self.count += count
+# C-accelerated JSON encoder; stdlib json remains the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 class BookStore:
-    def __init__(self, data_dir='data'):
+    def __init__(self, data_dir='data', use_minhash=False, lazy=False):
         self.books_file = os.path.join(data_dir, 'books.json')
         self.users_file = os.path.join(data_dir, 'users.json')
         
-        self.books = {} 
+        self.books = {}
         self.users = {}
+        # Incrementally maintained views for the routes/templates, so a
+        # page render never has to materialize dict values again
+        self.users_list = []
+        self.books_list = []
+        self.books_version = 0  # bumped whenever the catalog grows
+        self._catalog_cache = {}  # user_id -> ((user.version, books_version), list)
         self.book_subscribers = {} # Inverted Index
-        
+        # Cached |subscribers| per book, maintained by _add_to_index, so
+        # similarity math uses |A u B| = |A| + |B| - |A n B| without a
+        # len() over the live sets on every pair
+        self.book_sub_sizes = Counter()
+        # Memoized recommend_books results: user_id -> (version token,
+        # results). Tokens combine the version counters of the user and
+        # every co-subscriber, so stale entries miss on their own instead
+        # of needing an invalidation walk on every purchase.
+        self._rec_cache = {}
+        self._user_ver = {}  # user_id -> purchases seen for that user
+        # Running purchase counts; pop_top caches the top of the ranking
+        # and is refreshed lazily after a purchase marks it dirty
+        self.pop_counts = Counter()
+        self.pop_top = []  # (book_id, purchases) desc, at most 50 entries
+        self._pop_top_dirty = True
+
+        # Inverted index flattened to CSR arrays (only when numpy is
+        # available): book_uidx[book_indptr[b]:book_indptr[b+1]] holds the
+        # positions of book b's subscribers, so co-occurrence counting is
+        # one concatenate + bincount over contiguous uint32 memory.
+        self.book_indptr = None
+        self.book_uidx = None
+        self.user_k_arr = None
+        self._user_pos = {}   # user_id -> array position
+        self._pos_user = []   # array position -> user_id
+        self._index_dirty = True
+        # Purchases land here as small per-book overflow lists instead of
+        # forcing a full CSR rebuild; folded in on the next rebuild
+        self._index_delta = defaultdict(list)
+        self._index_delta_size = 0
+
+        # Approximate neighbor search (opt-in): MinHash signatures + LSH
+        # buckets make candidate retrieval near-constant-time at the cost
+        # of exactness. Off by default since the demo catalog is small.
+        self.minhash = MinHashIndex() if use_minhash else None
+
         # FP-GROWTH Structures
-        self.frequent_itemsets = {} 
+        self.frequent_itemsets = {}
         self.min_support = 1  # Low support for demo purposes
-        
-        self.load_data()
+
+        # Author -> [book_id, ...] index for the content fallback, so a
+        # same-author pick never scans the whole catalog
+        self.books_by_author = defaultdict(list)
+
+        # Item-item similarity table: book_id -> [(other_id, score), ...]
+        # top-20 by Jaccard over subscriber sets. Built once after load,
+        # patched in place on purchase, so retrieval is a dict lookup.
+        self.item_sim = {}
+
+        # Running support counters so a purchase only touches the counts
+        # it changes instead of re-mining the whole tree (see
+        # _update_fp_incremental). pair_counts keys are (min_id, max_id).
+        self.item_counts = defaultdict(int)
+        self.pair_counts = defaultdict(int)
+
+        # FP-tree in Struct-of-Arrays form: one flat list per field and a
+        # (parent_idx, item) -> idx dict instead of a per-node children
+        # dict. Node 0 is the root; -1 means "no node".
+        self.fp_item = []
+        self.fp_count = []
+        self.fp_parent = []
+        self.fp_link = []
+        self.fp_child = {}
+
+        # Write-behind persistence: mutators enqueue a save and return
+        # immediately; a daemon thread does the disk work. An empty-
+        # queue check coalesces click bursts into a single write. The
+        # worker is spawned lazily per process (_ensure_save_worker):
+        # threads do not survive fork(), so under gunicorn --preload
+        # each worker process must start its own consumer.
+        self._save_queue = queue.Queue()
+        self._save_lock = threading.Lock()
+        self._save_worker_pid = None
+        # Forked children also inherit the parent's locks in whatever
+        # state they were in at fork time; hand them fresh ones so a
+        # fork mid-load or mid-save cannot leave a lock held forever.
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+        # Lazy mode defers the JSON reads + FP-tree build to first use so
+        # server startup is not blocked on them (see ensure_loaded).
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        if not lazy:
+            self.ensure_loaded()
+
+    def ensure_loaded(self):
+        """Loads data on first call; safe to call from any thread."""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            self.load_data()
+            self._loaded = True
 
     # --- HELPER: UPDATE INVERTED INDEX ---
     def _add_to_index(self, user_id, book_id):
-        if book_id not in self.book_subscribers:
-            self.book_subscribers[book_id] = set()
-        self.book_subscribers[book_id].add(user_id)
+        subs = self.book_subscribers.get(book_id)
+        if subs is None:
+            subs = self.book_subscribers[book_id] = set()
+        if user_id not in subs:
+            subs.add(user_id)
+            self.book_sub_sizes[book_id] += 1
+            # Popularity is exactly "distinct subscribers", so tally it
+            # here and the same path covers bulk load and live purchases
+            self.pop_counts[book_id] += 1
+            self._pop_top_dirty = True
 
     # --- ALGORITHM: FP-GROWTH ---
     def run_fpgrowth(self):
@@ -50,17 +159,25 @@ class BookStore:
         for trans in transactions:
             for item in trans:
                 item_counts[item] += 1
-        
+        self.item_counts = item_counts
+
         # Filter & Sort Headers
+        # headers[item] = [count, head_idx, tail_idx]; the tail pointer
+        # makes appending to the node-link chain O(1)
         headers = {}
         for item, count in item_counts.items():
             if count >= self.min_support:
-                headers[item] = [count, None]
+                headers[item] = [count, -1, -1]
 
         if not headers: return
 
-        # 3. Build Tree
-        root = FPNode('Null', 1, None)
+        # 3. Build Tree (node 0 is the root)
+        self.fp_item = [-1]
+        self.fp_count = [1]
+        self.fp_parent = [-1]
+        self.fp_link = [-1]
+        self.fp_child = {}
+        root = 0
         
         for trans in transactions:
             local_items = {}
@@ -82,147 +199,556 @@ class BookStore:
                 self.frequent_itemsets[item] = prefix_paths
 
     def _insert_tree(self, items, node, headers):
-        first = items[0]
-        child = node.children.get(first)
-        if child:
-            child.increment(1)
-        else:
-            child = FPNode(first, 1, node)
-            node.children[first] = child
-            if headers[first][1] is None:
-                headers[first][1] = child
+        # Iterative descent: no recursion frame (or list slice) per item,
+        # and no RecursionError on long transactions
+        fp_child = self.fp_child
+        for item in items:
+            child = fp_child.get((node, item), -1)
+            if child != -1:
+                self.fp_count[child] += 1
             else:
-                current = headers[first][1]
-                while current.link:
-                    current = current.link
-                current.link = child
-        
-        if len(items) > 1:
-            self._insert_tree(items[1:], child, headers)
+                child = len(self.fp_item)
+                self.fp_item.append(item)
+                self.fp_count.append(1)
+                self.fp_parent.append(node)
+                self.fp_link.append(-1)
+                fp_child[(node, item)] = child
+                header = headers[item]
+                if header[1] == -1:
+                    header[1] = child
+                else:
+                    self.fp_link[header[2]] = child
+                header[2] = child
+            node = child
 
-    def _find_prefix_paths(self, base_pat, tree_node):
+    def _find_prefix_paths(self, base_pat, node):
+        # Most expensive traversal in mining: walk the item's node-link
+        # chain and ascend to the root from every node. Called once per
+        # header item per mining pass, so there is nothing to memoize.
         cond_pats = {}
-        while tree_node:
+        fp_link = self.fp_link
+        fp_count = self.fp_count
+        while node != -1:
             prefix_path = []
-            self._ascend_tree(tree_node.parent, prefix_path)
+            self._ascend_tree(self.fp_parent[node], prefix_path)
             if len(prefix_path) > 0:
+                count = fp_count[node]
                 for path_item in prefix_path:
-                    cond_pats[path_item] = cond_pats.get(path_item, 0) + tree_node.count
-            tree_node = tree_node.link
+                    cond_pats[path_item] = cond_pats.get(path_item, 0) + count
+            node = fp_link[node]
         return cond_pats
 
     def _ascend_tree(self, node, prefix_path):
-        if node.parent:
-            prefix_path.append(node.item)
-            self._ascend_tree(node.parent, prefix_path)
+        # Walk to the root iteratively; one frame total instead of one
+        # per tree level
+        fp_item = self.fp_item
+        fp_parent = self.fp_parent
+        while node > 0:
+            prefix_path.append(fp_item[node])
+            node = fp_parent[node]
 
     # --- STANDARD METHODS ---
     def load_data(self):
         print("Loading System Data...")
+        # Re-entrant: a child forked mid-warmup re-runs the load (the
+        # after-fork hook re-arms _load_lock for exactly that case), so
+        # reset every collection this method appends into before
+        # rebuilding — the rest below is reassigned wholesale.
+        self.books = {}
+        self.users = {}
+        self.books_list = []
+        self.users_list = []
+        self.books_by_author = defaultdict(list)
+        self.book_subscribers = {}
+        self.book_sub_sizes = Counter()
+        self.pop_counts = Counter()
+        self._pop_top_dirty = True
+        self._catalog_cache = {}
+        self._rec_cache = {}
+
         if os.path.exists(self.books_file):
-            with open(self.books_file, 'r') as f:
-                for item in json.load(f):
-                    b = Book(item['book_id'], item['title'], item['author'], item['genre'])
-                    self.books[b.book_id] = b
-        
+            for item in self._read_json(self.books_file):
+                b = Book(item['book_id'], item['title'], item['author'], item['genre'])
+                self.books[b.book_id] = b
+                self.books_list.append(b)
+                self.books_by_author[b.author].append(b.book_id)
+
         if os.path.exists(self.users_file):
-            with open(self.users_file, 'r') as f:
-                for item in json.load(f):
-                    u = User(item['user_id'], item['name'])
-                    for bid in item['purchased_books']:
-                        u.add_book(bid)
-                        self._add_to_index(u.user_id, bid)
-                    self.users[u.user_id] = u
+            for item in self._read_json(self.users_file):
+                u = User(item['user_id'], item['name'])
+                for bid in item['purchased_books']:
+                    u.add_book(bid)
+                    self._add_to_index(u.user_id, bid)
+                self.users[u.user_id] = u
+                self.users_list.append(u)
+
+        if self.minhash is not None:
+            for u in self.users.values():
+                self.minhash.add(u.user_id, u.purchased_books)
+
+        # Cold-start pair counts; kept current incrementally afterwards.
+        # Counter.update over combinations() keeps the per-user O(P^2)
+        # accumulation inside C instead of a Python double-loop with a
+        # dict write per pair; sorting first keeps keys (min_id, max_id).
+        # (A JIT-compiled pair kernel buys nothing here: the loop body is
+        # already C, and the counts land in a dict either way.)
+        pair_counts = Counter()
+        for user in self.users.values():
+            pair_counts.update(combinations(sorted(user.purchased_books), 2))
+        self.pair_counts = defaultdict(int, pair_counts)
 
         print("Building FP-Tree...")
         self.run_fpgrowth()
+        self._build_item_sim()
 
     def save_data(self):
-        users_data = [u.to_dict() for u in self.users.values()]
-        books_data = [b.to_dict() for b in self.books.values()]
-        with open(self.users_file, 'w') as f: json.dump(users_data, f, indent=4)
-        with open(self.books_file, 'w') as f: json.dump(books_data, f, indent=4)
+        # One writer at a time: flush() on the caller's thread and the
+        # background worker share the same .tmp staging paths.
+        with self._save_lock:
+            users_data = [u.to_dict() for u in self.users.values()]
+            books_data = [b.to_dict() for b in self.books.values()]
+            self._write_json(self.users_file, users_data)
+            self._write_json(self.books_file, books_data)
+
+    def _reset_after_fork(self):
+        """Re-arms thread state in a forked child process."""
+        self._load_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._save_worker_pid = None
+
+    def _ensure_save_worker(self):
+        """Starts the save worker for this process if it is not running."""
+        pid = os.getpid()
+        if self._save_worker_pid != pid:
+            with self._save_lock:
+                if self._save_worker_pid != pid:
+                    threading.Thread(target=self._save_worker, daemon=True).start()
+                    self._save_worker_pid = pid
+
+    def _schedule_save(self):
+        """Requests an asynchronous save (coalescing repeated requests)."""
+        self._ensure_save_worker()
+        if self._save_queue.empty():
+            self._save_queue.put(None)
+
+    def _save_worker(self):
+        while True:
+            self._save_queue.get()
+            try:
+                self.save_data()
+            except Exception as e:
+                print(f"Background save failed: {e}")
+
+    def flush(self):
+        """Synchronous save, for shutdown paths that must not lose data."""
+        self.save_data()
+
+    @staticmethod
+    def _read_json(path):
+        """Parses a JSON file with orjson when available (C decoder)."""
+        with open(path, 'rb') as f:
+            data = f.read()
+        return orjson.loads(data) if orjson is not None else json.loads(data)
+
+    @staticmethod
+    def _write_json(path, payload):
+        """Dumps payload to path via a temp file + atomic rename.
+
+        orjson encodes in C (roughly 5-10x faster than stdlib json on
+        these list-of-dict payloads); os.replace guarantees readers never
+        see a half-written file even if we crash mid-save.
+        """
+        if orjson is not None:
+            data = orjson.dumps(payload, option=orjson.OPT_INDENT_2)
+        else:
+            data = json.dumps(payload, indent=4).encode()
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
 
     def register_user(self, name):
         new_id = max(self.users.keys(), default=100) + 1
         new_user = User(new_id, name)
         self.users[new_id] = new_user
-        self.save_data()
+        self.users_list.append(new_user)
+        self._index_dirty = True
+        self._schedule_save()
         return new_id
 
     def add_book(self, title, author, genre):
         new_id = max(self.books.keys(), default=0) + 1
         new_book = Book(new_id, title, author, genre)
         self.books[new_id] = new_book
-        self.save_data()
+        self.books_list.append(new_book)
+        self.books_by_author[author].append(new_id)
+        self.books_version += 1
+        self._index_dirty = True
+        self._schedule_save()
         return new_id
 
+    def get_catalog(self, user_id):
+        """Books the user has not bought yet, cached per user.
+
+        The cache key pairs the user's history version with the catalog
+        version, so the filtered list is only rebuilt when one of them
+        actually changed.
+        """
+        user = self.users[user_id]
+        key = (user.version, self.books_version)
+        cached = self._catalog_cache.get(user_id)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        catalog = [b for b in self.books_list
+                   if b.book_id not in user.purchased_books]
+        self._catalog_cache[user_id] = (key, catalog)
+        return catalog
+
     def purchase_book(self, user_id, book_id):
         if user_id in self.users and book_id in self.books:
-            self.users[user_id].add_book(book_id)
+            user = self.users[user_id]
+            # Repeat purchase: add_book would dedupe the history, but the
+            # counters below would still double-count the pairs and the
+            # popularity tally — bail out before touching any of them.
+            if book_id in user.purchased_books:
+                return True
+            user.add_book(book_id)
             self._add_to_index(user_id, book_id)
-            self.save_data()
-            self.run_fpgrowth()
+            if self.minhash is not None:
+                self.minhash.add_item(user_id, book_id)
+            self._note_index_update(user_id, book_id)
+            self._user_ver[user_id] = self._user_ver.get(user_id, 0) + 1
+            self._update_fp_incremental(user_id, book_id)
+            # Persistence happens off-thread: the HTTP redirect (or Tk
+            # refresh) does not wait on two JSON file writes.
+            self._schedule_save()
             return True
         return False
 
+    def _build_item_sim(self):
+        """Builds the item-item Jaccard table from the pair counts."""
+        sizes = self.book_sub_sizes
+        per_item = defaultdict(list)
+        for (a, b), co in self.pair_counts.items():
+            union = sizes[a] + sizes[b] - co
+            if union > 0:
+                score = co / union
+                per_item[a].append((b, score))
+                per_item[b].append((a, score))
+        self.item_sim = {bid: heapq.nlargest(20, scored, key=lambda x: x[1])
+                         for bid, scored in per_item.items()}
+
+    def get_similar_items(self, target_book_id, k=5):
+        """Top-k books most similar to target_book_id — O(1) lookup."""
+        return self.item_sim.get(target_book_id, [])[:k]
+
+    def _patch_item_sim(self, a, b, co):
+        """Refreshes the (a, b) entry in both similarity rows in place."""
+        union = self.book_sub_sizes[a] + self.book_sub_sizes[b] - co
+        if union <= 0:
+            return
+        score = co / union
+        for row_id, other in ((a, b), (b, a)):
+            row = [e for e in self.item_sim.get(row_id, []) if e[0] != other]
+            row.append((other, score))
+            self.item_sim[row_id] = heapq.nlargest(20, row, key=lambda x: x[1])
+
+    def _co_count(self, a, b):
+        """Co-occurrence count for any pair, regardless of argument order.
+
+        pair_counts stores each pair once under its canonical (min, max)
+        key — half the entries and writes of a symmetric table — so
+        readers go through this accessor instead of probing both orders.
+        """
+        return self.pair_counts.get((a, b) if a < b else (b, a), 0)
+
+    def _update_fp_incremental(self, user_id, book_id):
+        """Folds a single purchase into the mined patterns.
+
+        One new purchase only changes the support of book_id and its
+        co-occurrence with the buyer's existing history, so updating
+        those counters is O(|history|) — no full run_fpgrowth() rebuild
+        (that stays as the cold-start build in load_data).
+        """
+        user = self.users[user_id]
+        self.item_counts[book_id] += 1
+        for b in user.purchased_books:
+            if b == book_id:
+                continue
+            count = self._co_count(b, book_id) + 1
+            self.pair_counts[(b, book_id) if b < book_id else (book_id, b)] = count
+            # Patch both affected rows of the pattern table in place
+            self.frequent_itemsets.setdefault(book_id, {})[b] = count
+            self.frequent_itemsets.setdefault(b, {})[book_id] = count
+            # ... and the similarity rows, so item_sim tracks live buys
+            self._patch_item_sim(b, book_id, count)
+
+    def _ver_for(self, user_id):
+        """Version token covering everything user_id's results depend on.
+
+        Recommendations change only when the user or a co-subscriber
+        buys something, so summing those version counters (weighted by
+        shared books) yields a token that moves exactly when a cached
+        result could be stale.
+        """
+        ver = self._user_ver.get(user_id, 0)
+        get_ver = self._user_ver.get
+        subs = self.book_subscribers
+        for bid in self.users[user_id].purchased_books:
+            for sub in subs.get(bid, ()):
+                ver += get_ver(sub, 0)
+        return ver
+
+    def _build_index_arrays(self):
+        """Flattens the inverted index into CSR arrays of user positions."""
+        users = list(self.users)
+        self._pos_user = users
+        self._user_pos = {uid: i for i, uid in enumerate(users)}
+        n_books = max(self.books, default=0) + 1
+        indptr = np.zeros(n_books + 1, dtype=np.int64)
+        for bid, subs in self.book_subscribers.items():
+            if bid < n_books:
+                indptr[bid + 1] = len(subs)
+        np.cumsum(indptr, out=indptr)
+        uidx = np.empty(int(indptr[-1]), dtype=np.uint32)
+        user_pos = self._user_pos
+        for bid, subs in self.book_subscribers.items():
+            if bid < n_books:
+                start = indptr[bid]
+                uidx[start:start + len(subs)] = sorted(user_pos[u] for u in subs)
+        self.book_indptr = indptr
+        self.book_uidx = uidx
+        self.user_k_arr = np.fromiter((u.k for u in self.users.values()),
+                                      dtype=np.int64, count=len(users))
+        self._index_delta.clear()
+        self._index_delta_size = 0
+        self._index_dirty = False
+
+    def _score_neighbors_vectorized(self, target_user):
+        """All neighbor Jaccard scores via one bincount reduction.
+
+        Concatenating the subscriber slices of the target's books and
+        bincounting them yields every intersection size in contiguous
+        numpy memory — the same counts as the fused dict pass, without
+        per-co-occurrence dict writes.
+        """
+        if self._index_dirty:
+            self._build_index_arrays()
+        indptr = self.book_indptr
+        delta = self._index_delta
+        parts = []
+        for b in target_user.purchased_books:
+            if b < len(indptr) - 1:
+                parts.append(self.book_uidx[indptr[b]:indptr[b + 1]])
+            if b in delta:
+                parts.append(np.asarray(delta[b], dtype=np.uint32))
+        if not parts:
+            return []
+        inter = np.bincount(np.concatenate(parts), minlength=len(self._pos_user))
+        inter[self._user_pos[target_user.user_id]] = 0
+        union = target_user.k + self.user_k_arr - inter
+        neighbors = []
+        for i in np.nonzero(inter)[0]:
+            neighbors.append((self.users[self._pos_user[i]],
+                              float(inter[i] / union[i])))
+        return neighbors
+
+    def _note_index_update(self, user_id, book_id):
+        """Records one purchase against the CSR index as a delta.
+
+        Known user buying a known book just appends to a small overflow
+        list consulted at scoring time; anything else (new rows/columns,
+        oversized delta, index not built yet) falls back to marking the
+        whole index for rebuild.
+        """
+        if np is None or self._index_dirty:
+            self._index_dirty = True
+            return
+        pos = self._user_pos.get(user_id)
+        if pos is None or book_id >= len(self.book_indptr) - 1 \
+                or self._index_delta_size >= 256:
+            self._index_dirty = True
+            return
+        self._index_delta[book_id].append(pos)
+        self.user_k_arr[pos] += 1
+        self._index_delta_size += 1
+
+    def _score_neighbors_fused(self, target_user):
+        """Candidate generation and Jaccard scoring fused in one pass.
+
+        Walking the inverted-index rows of the target's books counts, per
+        co-subscriber, exactly the number of shared books — which *is*
+        the intersection size. No candidate set is materialized and no
+        per-pair set ops run; unions come from |A|+|B|-|A n B|.
+        """
+        inter = defaultdict(int)
+        subs = self.book_subscribers
+        target_id = target_user.user_id
+        for bid in target_user.purchased_books:
+            for uid in subs.get(bid, ()):
+                if uid != target_id:
+                    inter[uid] += 1
+        tgt_k = target_user.k
+        users = self.users
+        neighbors = []
+        for uid, co in inter.items():
+            union = tgt_k + users[uid].k - co
+            if union:
+                neighbors.append((users[uid], co / union))
+        return neighbors
+
+    def _top_popular(self, n, exclude=()):
+        """Top-n most purchased books as ready-made recommendations.
+
+        The popularity ranking is cached and only re-sorted after a
+        purchase flips the dirty flag, so the cold-start path never
+        rescans every user's history.
+        """
+        if self._pop_top_dirty:
+            self.pop_top = self.pop_counts.most_common(50)
+            self._pop_top_dirty = False
+        picks = []
+        for bid, _ in self.pop_top:
+            if bid in exclude: continue
+            picks.append({"book": self.books[bid], "reason": "Trending", "algo": "Best Seller"})
+            if len(picks) >= n: break
+        return picks
+
     def calculate_jaccard_similarity(self, user1, user2):
-        a, b = user1.purchased_books, user2.purchased_books
-        return len(a & b) / len(a | b) if len(a | b) > 0 else 0
+        # Bitwise AND + popcount on the bitset mirror: no temporary sets,
+        # and |A u B| comes from the identity |A| + |B| - |A n B|.
+        # This beats hashed-set (and sorted-array) intersection outright —
+        # one machine-word AND covers 64 book ids at a time.
+        inter = (user1.bits & user2.bits).bit_count()
+        union = user1.k + user2.k - inter
+        return inter / union if union > 0 else 0
 
     # --- THE MISSING FUNCTION THAT CAUSED YOUR ERROR ---
     def recommend_books(self, target_user_id):
         if target_user_id not in self.users: return []
+        token = self._ver_for(target_user_id)
+        cached = self._rec_cache.get(target_user_id)
+        if cached is not None and cached[0] == token:
+            return cached[1]
         target_user = self.users[target_user_id]
+        # Locals for the hot loops: LOAD_FAST instead of LOAD_ATTR +
+        # dict lookup on every candidate
+        books = self.books
+        tgt = target_user.purchased_books
+
+        # Cold start: no history means no candidates, no neighbors and no
+        # pattern hits — go straight to the popularity ranking. Never
+        # cached: a cold-start user has no co-subscribers, so their token
+        # stays 0 forever and a cached list would outlive any reordering
+        # of the ranking. _top_popular is already a cached slice anyway.
+        if not tgt:
+            return self._top_popular(5)
+
         results = []
         rec_ids = set()
 
         # 1. USER-BASED CF
-        candidates = set()
-        for bid in target_user.purchased_books:
-            candidates.update(self.book_subscribers.get(bid, set()))
-        candidates.discard(target_user_id)
-        
-        neighbors = []
-        for nid in candidates:
-            score = self.calculate_jaccard_similarity(target_user, self.users[nid])
-            if score > 0: neighbors.append((self.users[nid], score))
-        neighbors.sort(key=lambda x: x[1], reverse=True)
-        
-        # Limit to top 2 neighbors to allow other algos to show
-        for neighbor, score in neighbors[:2]:
-            new_books = neighbor.purchased_books - target_user.purchased_books
-            count = 0
-            for bid in new_books:
-                if bid not in rec_ids and count < 2:
-                    results.append({"book": self.books[bid], "reason": "Because you read similar books", "algo": "User Similarity"})
-                    rec_ids.add(bid)
-                    count += 1
+        if self.minhash is not None:
+            # Approximate mode: candidates come from LSH bucket collisions
+            # and scores from signature agreement — no exact Jaccard at all.
+            neighbors = []
+            for nid in self.minhash.candidates(target_user_id):
+                score = self.minhash.similarity(target_user_id, nid)
+                if score > 0: neighbors.append((self.users[nid], score))
+        elif np is not None:
+            neighbors = self._score_neighbors_vectorized(target_user)
+        else:
+            neighbors = self._score_neighbors_fused(target_user)
+        # Top-2 only: O(N log 2) heap selection instead of a full sort
+        # (limit keeps room for the other algos to show)
+        book_scores = defaultdict(float)
+        top_neighbors = heapq.nlargest(2, neighbors, key=lambda x: x[1])
+        for neighbor, score in top_neighbors:
+            # Accumulate similarity-weighted scores directly; no temporary
+            # difference set per neighbor, tgt membership tested in place
+            for bid in neighbor.purchased_books:
+                if bid not in tgt:
+                    book_scores[bid] += score
+        # Reason text is built once, for the kept neighbors only — never
+        # per scored candidate
+        reason = "Because you read similar books"
+        if top_neighbors:
+            shared = tgt.intersection(top_neighbors[0][0].purchased_books)
+            titles = [books[bid].title for bid in shared if bid in books]
+            if titles:
+                reason = f"Because you read {' & '.join(titles[:2])}"
+        for bid, _ in heapq.nlargest(4, book_scores.items(), key=lambda x: x[1]):
+            results.append({"book": books[bid], "reason": reason, "algo": "User Similarity"})
+            rec_ids.add(bid)
 
         # 2. FP-GROWTH
-        if len(results) < 5 and target_user.purchased_books:
-            fp_scores = {}
-            for my_book in target_user.purchased_books:
+        if len(results) < 5 and tgt:
+            # Counter += skips the .get(..., 0) lookup-and-branch per hit.
+            # One fused exclusion set per phase: a single membership test
+            # per candidate instead of two (a bloom filter in front would
+            # only pay off at far larger history sizes)
+            exclude = tgt | rec_ids
+            fp_scores = Counter()
+            for my_book in tgt:
                 if my_book in self.frequent_itemsets:
                     related_items = self.frequent_itemsets[my_book]
                     for rel_id, count in related_items.items():
-                        if rel_id not in target_user.purchased_books and rel_id not in rec_ids:
-                            fp_scores[rel_id] = fp_scores.get(rel_id, 0) + count
+                        if rel_id not in exclude:
+                            fp_scores[rel_id] += count
             
-            sorted_fp = sorted(fp_scores.items(), key=lambda x: x[1], reverse=True)
-            for bid, score in sorted_fp[:2]:
+            top_fp = heapq.nlargest(2, fp_scores.items(), key=lambda x: x[1])
+            for bid, score in top_fp:
                 if len(results) >= 5: break
-                results.append({"book": self.books[bid], "reason": "Found in Frequent Pattern Tree", "algo": "FP-Growth"})
+                results.append({"book": books[bid], "reason": "Found in Frequent Pattern Tree", "algo": "FP-Growth"})
                 rec_ids.add(bid)
 
-        # 3. POPULARITY FALLBACK
+        # 3. ITEM-ITEM SIMILARITY ("readers also bought")
+        if len(results) < 5 and tgt:
+            item_scores = defaultdict(lambda: {'score': 0.0, 'trigger': ''})
+            # Read the precomputed rows directly: P dict lookups total,
+            # no method call or slice per purchased book
+            item_sim = self.item_sim
+            exclude = tgt | rec_ids
+            for my_bid in tgt:
+                row = item_sim.get(my_bid)
+                if not row:
+                    continue
+                for twin_id, score in row[:3]:
+                    if twin_id in exclude:
+                        continue
+                    # Keep the strongest trigger book, not a sum — "similar
+                    # to X" should name the single best X
+                    entry = item_scores[twin_id]
+                    if score > entry['score']:
+                        entry['score'] = score
+                        entry['trigger'] = books[my_bid].title
+            top_items = heapq.nlargest(2, item_scores.items(),
+                                       key=lambda kv: kv[1]['score'])
+            for twin_id, info in top_items:
+                if len(results) >= 5: break
+                results.append({"book": books[twin_id], "reason": f"Similar to {info['trigger']}", "algo": "Item Similarity"})
+                rec_ids.add(twin_id)
+
+        # 4. CONTENT FALLBACK (same-author picks via the author index)
+        if len(results) < 5 and tgt:
+            liked_authors = {books[bid].author
+                             for bid in tgt
+                             if bid in self.books}
+            exclude = tgt | rec_ids
+            for author in liked_authors:
+                for bid in self.books_by_author.get(author, ()):
+                    if bid in exclude:
+                        continue
+                    results.append({"book": books[bid], "reason": f"More from {author}", "algo": "Author Match"})
+                    rec_ids.add(bid)
+                    if len(results) >= 5: break
+                if len(results) >= 5: break
+
+        # 5. POPULARITY FALLBACK — bypasses the cache for the same
+        # reason as the cold-start branch: the token does not track
+        # popularity, which is this result's only input
         if not results:
-            pop = {}
-            for u in self.users.values():
-                for b in u.purchased_books: pop[b] = pop.get(b, 0) + 1
-            sorted_pop = sorted(pop.items(), key=lambda x: x[1], reverse=True)
-            for bid, _ in sorted_pop[:5]:
-                if bid not in target_user.purchased_books:
-                     results.append({"book": self.books[bid], "reason": "Trending", "algo": "Best Seller"})
+            return self._top_popular(5, exclude=tgt)
 
+        self._rec_cache[target_user_id] = (token, results)
         return results
\ No newline at end of file
@@ -0,0 +1,102 @@
+# core/minhash.py
+"""MinHash signatures + banded LSH for approximate Jaccard neighbors.
+
+Instead of scoring every candidate exactly, each user's book set is
+summarized by a fixed-length signature of per-hash minima. Users whose
+signatures collide in at least one LSH band are likely similar, so
+neighbor retrieval becomes a handful of bucket lookups instead of a
+scan. Uses universal hashing ((a*x + b) mod prime) so there is no
+dependency on an external hash library.
+"""
+
+import random
+
+# Mersenne prime keeps (a*x + b) % _PRIME cheap and well distributed
+_PRIME = (1 << 61) - 1
+
+
+class MinHashIndex:
+    """Maintains MinHash signatures and banded LSH buckets per user."""
+
+    def __init__(self, num_hashes=128, bands=16, seed=42):
+        if num_hashes % bands != 0:
+            raise ValueError("num_hashes must be divisible by bands")
+        self.num_hashes = num_hashes
+        self.bands = bands
+        self.rows = num_hashes // bands
+        rng = random.Random(seed)
+        self._a = [rng.randrange(1, _PRIME) for _ in range(num_hashes)]
+        self._b = [rng.randrange(0, _PRIME) for _ in range(num_hashes)]
+        self._sigs = {}                      # user_id -> list of minima
+        self._buckets = [{} for _ in range(bands)]  # band -> key -> set(user_id)
+
+    def signature(self, items):
+        """Full signature of an item set (one min per hash function)."""
+        sig = []
+        for a, b in zip(self._a, self._b):
+            sig.append(min((a * x + b) % _PRIME for x in items))
+        return sig
+
+    def _band_keys(self, sig):
+        for band in range(self.bands):
+            yield band, tuple(sig[band * self.rows:(band + 1) * self.rows])
+
+    def _insert(self, user_id, sig):
+        for band, key in self._band_keys(sig):
+            self._buckets[band].setdefault(key, set()).add(user_id)
+
+    def _remove(self, user_id, sig):
+        for band, key in self._band_keys(sig):
+            bucket = self._buckets[band].get(key)
+            if bucket:
+                bucket.discard(user_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def add(self, user_id, items):
+        """Indexes a user's item set (replacing any previous signature)."""
+        if not items:
+            return
+        old = self._sigs.get(user_id)
+        if old is not None:
+            self._remove(user_id, old)
+        sig = self.signature(items)
+        self._sigs[user_id] = sig
+        self._insert(user_id, sig)
+
+    def add_item(self, user_id, item):
+        """Incrementally folds one new item into an existing signature.
+
+        min is order-independent, so only positions where the new item
+        hashes below the current minimum change.
+        """
+        sig = self._sigs.get(user_id)
+        if sig is None:
+            self.add(user_id, {item})
+            return
+        self._remove(user_id, sig)
+        for i, (a, b) in enumerate(zip(self._a, self._b)):
+            h = (a * item + b) % _PRIME
+            if h < sig[i]:
+                sig[i] = h
+        self._insert(user_id, sig)
+
+    def candidates(self, user_id):
+        """All users sharing at least one LSH bucket with this user."""
+        sig = self._sigs.get(user_id)
+        if sig is None:
+            return set()
+        found = set()
+        for band, key in self._band_keys(sig):
+            found.update(self._buckets[band].get(key, ()))
+        found.discard(user_id)
+        return found
+
+    def similarity(self, user_a, user_b):
+        """Approximate Jaccard: fraction of matching signature positions."""
+        sig_a = self._sigs.get(user_a)
+        sig_b = self._sigs.get(user_b)
+        if sig_a is None or sig_b is None:
+            return 0.0
+        equal = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+        return equal / self.num_hashes
@@ -2,6 +2,10 @@
 
 class Book:
     """Represents a book in the store."""
+    # Fixed attribute slots: no per-instance __dict__, which roughly
+    # halves the footprint of a catalog held entirely in memory
+    __slots__ = ('book_id', 'title', 'author', 'genre')
+
     def __init__(self, book_id, title, author, genre):
         self.book_id = int(book_id)
         self.title = title
@@ -19,20 +23,43 @@ class Book:
 
 class User:
     """Represents a user and their reading history."""
+    __slots__ = ('user_id', 'name', 'purchased_books', 'bits', 'k', 'version',
+                 '_dict_cache')
+
     def __init__(self, user_id, name):
         self.user_id = int(user_id)
         self.name = name
         # The 'Set' is crucial for Jaccard Similarity (Fast Math)
-        self.purchased_books = set() 
+        self.purchased_books = set()
+        # Bitset mirror of the history: bit N set <=> book N purchased.
+        # Lets Jaccard use a bitwise AND + popcount instead of set ops.
+        self.bits = 0
+        # Cached |purchased_books| so hot loops use the closed form
+        # |A u B| = k_a + k_b - |A n B| without any len() calls
+        self.k = 0
+        # Bumped on every new purchase; caches keyed on it go stale
+        self.version = 0
+        # Serialized form, rebuilt only after the history changes
+        self._dict_cache = None
 
     def add_book(self, book_id):
         """Adds a book ID to the user's history."""
-        self.purchased_books.add(int(book_id))
+        book_id = int(book_id)
+        if book_id not in self.purchased_books:
+            self.purchased_books.add(book_id)
+            self.bits |= 1 << book_id
+            self.k += 1
+            self.version += 1
+            self._dict_cache = None
 
     def to_dict(self):
         """Converts object to dictionary (Sets become Lists here)."""
-        return {
-            "user_id": self.user_id,
-            "name": self.name,
-            "purchased_books": list(self.purchased_books)
-        }
\ No newline at end of file
+        # Cached between purchases: save_data serializes every user on
+        # each flush, and sorting keeps the on-disk file diff-friendly
+        if self._dict_cache is None:
+            self._dict_cache = {
+                "user_id": self.user_id,
+                "name": self.name,
+                "purchased_books": sorted(self.purchased_books)
+            }
+        return self._dict_cache
\ No newline at end of file
@@ -25,6 +25,10 @@ class ModernBookstoreApp:
         # Initialize Logic
         self.store = BookStore()
         self.current_user = None
+
+        # Persistence is write-behind (BookStore._save_worker), so make
+        # sure queued saves reach disk before the window goes away.
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Setup Styling
         self.setup_styles()
@@ -105,7 +109,7 @@ class ModernBookstoreApp:
     def render_login_view(self):
         self.clear_main_area()
         self.create_nav_btn("User Database", self.render_login_view, active=True)
-        self.create_nav_btn("Exit System", self.root.quit)
+        self.create_nav_btn("Exit System", self.on_close)
 
         # Header
         header = ttk.Frame(self.main_area, style="Main.TFrame")
@@ -234,31 +238,67 @@ class ModernBookstoreApp:
         # Load Data
         self.refresh_dashboard_data()
 
+    # Treeview rendering cost is O(rows) even offscreen, so page the
+    # catalog table instead of inserting every book after each purchase
+    CATALOG_ROW_LIMIT = 200
+
     def refresh_dashboard_data(self):
-        # 1. Load Recs
-        for i in self.rec_tree.get_children(): self.rec_tree.delete(i)
-        
+        # 1. Load Recs (single delete call, rows built before inserting)
+        self.rec_tree.delete(*self.rec_tree.get_children())
+
         recs = self.store.recommend_books(self.current_user.user_id)
-        for item in recs:
-            # We combine Book title and Algo type for clarity
-            title = f"{item['book'].title} ({item['book'].genre})"
-            logic = f"[{item.get('algo', 'AI')}] {item['reason']}"
-            self.rec_tree.insert("", "end", values=(title, logic))
-
-        # 2. Load Catalog
-        for i in self.cat_tree.get_children(): self.cat_tree.delete(i)
-        
-        for b in self.store.books.values():
-            if b.book_id not in self.current_user.purchased_books:
-                self.cat_tree.insert("", "end", values=(b.book_id, b.title, b.genre))
+        rec_rows = [(f"{item['book'].title} ({item['book'].genre})",
+                     f"[{item.get('algo', 'AI')}] {item['reason']}")
+                    for item in recs]
+        for row in rec_rows:
+            self.rec_tree.insert("", "end", values=row)
+
+        # 2. Load Catalog (paged: first CATALOG_ROW_LIMIT rows, then a
+        # "load more" row that appends the next page on double-click)
+        self.cat_tree.delete(*self.cat_tree.get_children())
+
+        purchased = self.current_user.purchased_books
+        self._cat_rows = [(b.book_id, b.title, b.genre)
+                          for b in self.store.books_list
+                          if b.book_id not in purchased]
+        self._cat_shown = 0
+        self._cat_more_iid = None
+        self._show_more_catalog()
+
+    def _show_more_catalog(self):
+        """Appends the next catalog page to the table."""
+        if self._cat_more_iid is not None:
+            self.cat_tree.delete(self._cat_more_iid)
+            self._cat_more_iid = None
+
+        page = self._cat_rows[self._cat_shown:self._cat_shown + self.CATALOG_ROW_LIMIT]
+        for row in page:
+            self.cat_tree.insert("", "end", values=row)
+        self._cat_shown += len(page)
+
+        remaining = len(self._cat_rows) - self._cat_shown
+        if remaining > 0:
+            self._cat_more_iid = self.cat_tree.insert(
+                "", "end", values=("▼", f"Double-click to load more ({remaining} remaining)", ""))
+        # One deferred redraw after the batch instead of one per insert
+        self.cat_tree.update_idletasks()
 
     # ==========================================
     # ACTIONS & POPUPS
     # ==========================================
+    def on_close(self):
+        """Synchronous final save, then tear down the window."""
+        self.store.flush()
+        self.root.destroy()
+
     def on_buy_book(self, event):
         selected = self.cat_tree.selection()
         if not selected: return
-        
+
+        if selected[0] == self._cat_more_iid:
+            self._show_more_catalog()
+            return
+
         item = self.cat_tree.item(selected[0])
         book_id = item['values'][0]
         title = item['values'][1]